@@ -4,10 +4,13 @@ Streamlit dashboard for LSCO logistics: consumption vs capacity.
 """
 
 import os
+import re
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import math
+from collections import defaultdict
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Constants & Version
@@ -16,14 +19,46 @@ RATE_SUFFIX = "_rate"
 CAP_SUFFIX  = "_cap"
 CONSUMPTION_CSV = "consumption.csv"
 CAPACITY_CSV    = "capacities.csv"
+MAX_COUNT       = int(np.iinfo(np.int32).max)   # unit counts are held as int32
+
+# Subtype column → (prefix, base, kind, variant) in one pass, e.g.
+# CL_III_JP8_bulk_cap → ("CL_III", "CL_III_JP8", "_cap", "_bulk")
+_CLASSIFY = re.compile(
+    r"^(?P<base>(?P<prefix>CL_[^_]+|[^_]+).*?)"
+    rf"(?:(?P<variant>_bulk|_wheeled)(?={re.escape(CAP_SUFFIX)}$))?"
+    rf"(?P<kind>{re.escape(RATE_SUFFIX)}|{re.escape(CAP_SUFFIX)})$"
+)
 # ──────────────────────────────────────────────────────────────────────────────
 
+def _df_hash(df):
+    """Cache key for DataFrame args: schema plus pandas' vectorized row hash."""
+    return (
+        tuple(df.columns),
+        tuple(df.dtypes.astype(str)),
+        pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes(),
+    )
+
+def _series_hash(s):
+    """Cache key for Series args, analogous to _df_hash."""
+    return (str(s.dtype), pd.util.hash_pandas_object(s, index=True).to_numpy().tobytes())
+
+# Used by every cached function that takes frames/Series, instead of
+# Streamlit's default serialization-based hashing
+HASH_FUNCS = {pd.DataFrame: _df_hash, pd.Series: _series_hash}
+
+def read_csv(path):
+    """Read a CSV with the PyArrow engine, falling back to the C engine."""
+    try:
+        return pd.read_csv(path, engine="pyarrow", dtype_backend="pyarrow")
+    except ImportError:
+        return pd.read_csv(path)
+
 def load_consumption(path):
     """Load consumption CSV, validate unit_type/action and at least one *_rate."""
     if not os.path.exists(path):
         st.error(f"Consumption CSV not found: {path}")
         st.stop()
-    df = pd.read_csv(path)
+    df = read_csv(path)
     if 'unit_type' not in df.columns or 'action' not in df.columns:
         st.error(f"{path} must contain 'unit_type' and 'action' columns.")
         st.stop()
@@ -37,7 +72,7 @@ def load_capacity(path):
     if not os.path.exists(path):
         st.error(f"Capacity CSV not found: {path}")
         st.stop()
-    df = pd.read_csv(path)
+    df = read_csv(path)
     if 'unit_type' not in df.columns:
         st.error(f"{path} must contain 'unit_type' column.")
         st.stop()
@@ -53,95 +88,209 @@ def load_data():
     cap  = load_capacity(CAPACITY_CSV)
     return cons, cap
 
+@st.cache_data(show_spinner=False, hash_funcs=HASH_FUNCS)
+def action_index_map(cons_df):
+    """Map each action to the positional row indices it occupies in cons_df.
+
+    Rows with a missing action (e.g. blank rows added in the editor) are skipped.
+    """
+    return cons_df.groupby("action", sort=False, dropna=True).indices
+
+def _action_rows(cons_df, action):
+    """Positional rows of cons_df for action, via the cached index map."""
+    return action_index_map(cons_df).get(action, np.empty(0, dtype=np.intp))
+
+@st.cache_data(show_spinner=False, hash_funcs=HASH_FUNCS)
+def subtype_matrix(df, suffix):
+    """Contiguous float matrix of every *suffix column in df, plus column→index."""
+    cols = list(subtype_columns(df.columns, suffix))
+    matrix = np.ascontiguousarray(df[cols].to_numpy(dtype=np.float64, na_value=0.0))
+    return matrix, {c: i for i, c in enumerate(cols)}   # blanks count as 0
+
+@st.cache_data(show_spinner=False, hash_funcs=HASH_FUNCS)
+def unit_codes(df):
+    """Factorize df's unit_type once per frame into (categories, per-row codes).
+
+    Done here rather than as a categorical dtype in load_data, which would
+    restrict the editor's unit_type column to the existing categories.
+    """
+    codes, categories = pd.factorize(df["unit_type"])
+    return list(categories), codes
+
+def _counts_and_matrix(df, unit_counts, cols, suffix, rows=None):
+    """Return (per-row unit counts, matrix of cols) for df, optionally for rows only."""
+    categories, codes = unit_codes(df)
+    # One count per category plus a trailing 0 that code -1 (missing) picks up
+    counts_by_code = np.array(
+        [unit_counts.get(u, 0) for u in categories] + [0],
+        dtype=np.int32,
+    )
+    counts = counts_by_code[codes]
+    matrix, col_idx = subtype_matrix(df, suffix)
+    matrix = matrix[:, [col_idx[c] for c in cols]]
+    if rows is not None:
+        counts, matrix = counts[rows], matrix[rows]
+    return counts, matrix
+
+@st.cache_data(show_spinner=False, hash_funcs=HASH_FUNCS)
 def compute_totals(cons_df, cap_df, action, unit_counts, sel_rates, sel_caps):
-    """Compute detailed and total consumption/capacity for the selected action."""
-    # Consumption
-    req = cons_df[cons_df["action"] == action].copy()
-    req["count"] = req["unit_type"].map(unit_counts).fillna(0).astype(int)
-    req_detail = req[["unit_type","action","count"] + sel_rates].copy()
-    req_detail.loc[:, sel_rates] = req_detail[sel_rates].multiply(req_detail["count"], axis=0)
-    total_req = req_detail[sel_rates].sum()
+    """Compute total consumption/capacity for the selected action.
+
+    Cached on its inputs, so unit_counts is passed as a tuple of (unit, count)
+    pairs and sel_rates/sel_caps as tuples.
+    """
+    unit_counts = dict(unit_counts)
+    sel_rates   = list(sel_rates)
+    sel_caps    = list(sel_caps)
+
+    # Consumption: totals = counts · rate matrix in a single matmul
+    rows = _action_rows(cons_df, action)
+    req_counts, rate_matrix = _counts_and_matrix(cons_df, unit_counts, sel_rates, RATE_SUFFIX, rows)
+    total_req = pd.Series(rate_matrix.T @ req_counts, index=sel_rates)
 
     # Capacity
-    cap = cap_df.copy()
-    cap["count"] = cap["unit_type"].map(unit_counts).fillna(0).astype(int)
-    cap_detail = cap[["unit_type","count"] + sel_caps].copy()
-    cap_detail.loc[:, sel_caps] = cap_detail[sel_caps].multiply(cap_detail["count"], axis=0)
-    total_cap = cap_detail[sel_caps].sum()
-
-    return req_detail, cap_detail, total_req, total_cap
-
-def group_prefix(col):
-    """Determine grouping prefix for a subtype column."""
-    if col.startswith("CL_"):
-        parts = col.split("_")
-        return f"{parts[0]}_{parts[1]}"    # e.g. CL_III, CL_V, CL_IX
-    if col.startswith("Recovery_"):
-        return "Recovery"
-    return col.split("_")[0]               # e.g. Javelin, 105mm
-
-def build_group_summary(total_req, total_cap, sel_rates, sel_caps):
-    groups = sorted({ group_prefix(c) for c in sel_rates + sel_caps })
-    rows = []
-    for grp in groups:
-        grp_rates = [c for c in sel_rates if group_prefix(c)==grp]
-        grp_caps  = [c for c in sel_caps  if group_prefix(c)==grp]
-
-        raw_req = total_req[grp_rates].sum() if grp_rates else 0
-        raw_cap = total_cap[grp_caps].sum()   if grp_caps  else 0
+    cap_counts, cap_matrix = _counts_and_matrix(cap_df, unit_counts, sel_caps, CAP_SUFFIX)
+    total_cap = pd.Series(cap_matrix.T @ cap_counts, index=sel_caps)
 
-        # BOTH floored
-        req_int     = math.floor(raw_req)
-        cap_int     = math.floor(raw_cap)
-        surplus_int = cap_int - req_int
-
-        # CL_III bulk/vwhe en detail (also floor)
-        bulk_keys  = [c for c in grp_caps if "_bulk_cap"    in c]
-        wheel_keys = [c for c in grp_caps if "_wheeled_cap" in c]
-        bulk_int   = math.floor(total_cap[bulk_keys].sum())   if bulk_keys  else None
-        wheel_int  = math.floor(total_cap[wheel_keys].sum())  if wheel_keys else None
-        bulk_sur   = bulk_int - req_int if bulk_int   is not None else None
-        wheel_sur  = wheel_int - req_int if wheel_int  is not None else None
-
-        # Deficit only if group deficit
-        deficit = []
-        if surplus_int < 0:
-            for rate in grp_rates:
-                base = rate.replace(RATE_SUFFIX,"")
-                cap_matches = [c for c in sel_caps if c.startswith(base)]
-                raw_c = sum(total_cap[c] for c in cap_matches)
-                cap_i = math.floor(raw_c)
-                req_i = math.floor(total_req[rate])
-                if req_i > cap_i:
-                    deficit.append(base)
-
-        row = {
-            "Group": grp,
-            "Requirement": req_int,
-            "Capacity":    cap_int,
-            "Surplus/(Deficit)": surplus_int,
-            "Deficit Subtypes": ", ".join(deficit) if deficit else "-"
-        }
-        if bulk_int is not None:
-            row["Bulk Cap"]     = bulk_int
-            row["Bulk Surplus"] = bulk_sur
-        if wheel_int is not None:
-            row["Wheeled Cap"]     = wheel_int
-            row["Wheeled Surplus"] = wheel_sur
-
-        rows.append(row)
-
-    return pd.DataFrame(rows).set_index("Group")
+    return total_req, total_cap
+
+@st.cache_data(show_spinner=False, hash_funcs=HASH_FUNCS)
+def build_detail_frames(cons_df, cap_df, action, unit_counts, sel_rates, sel_caps):
+    """Per-unit consumption/capacity breakdown (post-count) for Raw Details.
+
+    Same arguments as compute_totals; only called when the breakdown is shown.
+    """
+    unit_counts = dict(unit_counts)
+    sel_rates   = list(sel_rates)
+    sel_caps    = list(sel_caps)
+
+    rows = _action_rows(cons_df, action)
+    req = cons_df[["unit_type","action"]].iloc[rows]
+    req_counts, rate_matrix = _counts_and_matrix(cons_df, unit_counts, sel_rates, RATE_SUFFIX, rows)
+    req_detail = pd.DataFrame({
+        "unit_type": req["unit_type"].to_numpy(),
+        "action":    req["action"].to_numpy(),
+        "count":     req_counts,
+        **{c: rate_matrix[:, i] * req_counts for i, c in enumerate(sel_rates)},
+    }, index=req.index)
+
+    cap_counts, cap_matrix = _counts_and_matrix(cap_df, unit_counts, sel_caps, CAP_SUFFIX)
+    cap_detail = pd.DataFrame({
+        "unit_type": cap_df["unit_type"].to_numpy(),
+        "count":     cap_counts,
+        **{c: cap_matrix[:, i] * cap_counts for i, c in enumerate(sel_caps)},
+    }, index=cap_df.index)
+
+    return req_detail, cap_detail
+
+@st.cache_data(show_spinner=False)
+def column_meta(columns):
+    """Classify subtype columns (tuple of names) as {col: (prefix, base, kind, variant)}.
+
+    prefix is the group (CL_III, CL_V, Recovery, ...), base the subtype without
+    its suffix or bulk/wheeled variant, and kind RATE_SUFFIX or CAP_SUFFIX.
+    Columns that are not subtypes are left out.
+    """
+    meta = {}
+    for c in columns:
+        m = _CLASSIFY.match(c)
+        if m:
+            meta[c] = (m["prefix"], m["base"], m["kind"], m["variant"])
+    return meta
+
+def subtype_columns(columns, kind):
+    """Tuple of the columns classified as kind (RATE_SUFFIX or CAP_SUFFIX), in order."""
+    meta = column_meta(tuple(columns))
+    return tuple(c for c in columns if c in meta and meta[c][2] == kind)
+
+@st.cache_data(show_spinner=False)
+def caps_by_base(cap_cols, col_meta):
+    """Map each subtype base to its capacity columns (cap_cols is a tuple)."""
+    base_to_caps = defaultdict(list)
+    for c in cap_cols:
+        base_to_caps[col_meta[c][1]].append(c)
+    return dict(base_to_caps)
+
+def _grouped(totals, cols, col_meta):
+    """Re-index a totals Series by (group, base) for groupby aggregation."""
+    index = pd.MultiIndex.from_arrays(
+        [[col_meta[c][0] for c in cols], [col_meta[c][1] for c in cols]],
+        names=["group", "base"],
+    )
+    return pd.Series(totals[cols].to_numpy(dtype=np.float64), index=index)
+
+@st.cache_data(show_spinner=False, hash_funcs=HASH_FUNCS)
+def build_group_summary(total_req, total_cap, sel_rates, sel_caps, col_meta):
+    """Roll totals up by group prefix. sel_rates/sel_caps are tuples (cache key)."""
+    sel_rates = list(sel_rates)
+    sel_caps  = list(sel_caps)
+    req_s = _grouped(total_req, sel_rates, col_meta)
+    cap_s = _grouped(total_cap, sel_caps,  col_meta)
+
+    variants = [col_meta[c][3] for c in sel_caps]
+    is_bulk  = np.array([v == "_bulk"    for v in variants], dtype=bool)
+    is_wheel = np.array([v == "_wheeled" for v in variants], dtype=bool)
+
+    # Long form (kind, group, base) -> value, pivoted to one column per kind
+    long_s = pd.concat(
+        {"req": req_s, "cap": cap_s, "bulk": cap_s[is_bulk], "wheel": cap_s[is_wheel]},
+        names=["kind"],
+    )
+    by_base = long_s.groupby(level=["group", "base", "kind"]).sum().unstack("kind")
+    # BOTH floored; bulk/wheeled stay NaN for groups without them
+    by_grp  = np.floor(by_base.groupby(level="group").sum(min_count=1))
+
+    req_int     = by_grp["req"].fillna(0).astype(np.int64)
+    cap_int     = by_grp["cap"].fillna(0).astype(np.int64)
+    surplus_int = cap_int - req_int
+
+    # Deficit only if group deficit: subtypes whose floored requirement
+    # exceeds the floored capacity of the same base (in sel_rates order)
+    base_df   = np.floor(by_base.reindex(req_s.index))
+    grp_short = surplus_int.reindex(base_df.index.get_level_values("group")).to_numpy() < 0
+    short = base_df.index[(base_df["req"] > base_df["cap"].fillna(0)).to_numpy() & grp_short]
+    deficit = (
+        pd.Series(short.get_level_values("base"), index=short.get_level_values("group"))
+        .groupby(level=0).agg(", ".join)
+    )
+
+    summary = pd.DataFrame({
+        "Requirement": req_int,
+        "Capacity":    cap_int,
+        "Surplus/(Deficit)": surplus_int,
+        "Deficit Subtypes": deficit.reindex(by_grp.index, fill_value="-"),
+    })
+    summary.index.name = "Group"
+
+    # CL_III bulk/wheeled en detail
+    for kind, label in (("bulk", "Bulk"), ("wheel", "Wheeled")):
+        if kind in by_grp:
+            summary[f"{label} Cap"]     = by_grp[kind]
+            summary[f"{label} Surplus"] = by_grp[kind] - req_int
+
+    return summary
 
 
 
 def fmt_parenthesis(x):
     """Format an integer with commas and parentheses for negatives."""
-    if pd.isna(x):
-        return "-"
-    # x is assumed int already
+    # x is assumed int already; NaNs are masked by fmt_parenthesis_frame
     return f"({abs(x):,})" if x < 0 else f"{x:,}"
 
+def fmt_parenthesis_frame(df):
+    """Vectorized fmt_parenthesis over a numeric frame, with "-" for NaN.
+
+    NaNs are masked once for the whole frame; each unique value is then
+    formatted once and gathered back into place.
+    """
+    arr  = df.to_numpy(dtype=np.float64, na_value=np.nan)
+    mask = np.isnan(arr)
+    ints = np.where(mask, 0, arr).astype(np.int64)
+    uniq, inv = np.unique(ints.ravel(), return_inverse=True)
+    labels = np.array([fmt_parenthesis(u) for u in uniq.tolist()], dtype=object)
+    out = np.where(mask, "-", labels[inv.reshape(-1)].reshape(arr.shape))
+    return pd.DataFrame(out, index=df.index, columns=df.columns)
+
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -170,15 +319,36 @@ with st.sidebar.expander("Edit CSV Tables"):
 
 # Sidebar: Filters & Counts
 st.sidebar.header("Filters & Counts")
-action = st.sidebar.selectbox("Operational Action", cons_df["action"].unique())
-
-unit_counts = {
-    u: st.sidebar.number_input(f"{u} count", min_value=0, value=1, step=1)
-    for u in cons_df["unit_type"].unique()
-}
-
-rate_cols = [c for c in cons_df.columns if c.endswith(RATE_SUFFIX)]
-cap_cols  = [c for c in cap_df.columns  if c.endswith(CAP_SUFFIX)]
+action = st.sidebar.selectbox("Operational Action", cons_df["action"].dropna().unique())
+
+# One editable table for all unit counts instead of a number_input per unit
+counts_df = pd.DataFrame({
+    "unit_type": list(cons_df["unit_type"].dropna().unique()),
+    "count": 1,
+})
+counts_df = st.sidebar.data_editor(
+    counts_df,
+    disabled=["unit_type"],
+    hide_index=True,
+    key="counts",
+    column_config={"count": st.column_config.NumberColumn(min_value=0, max_value=MAX_COUNT, step=1)},
+)
+unit_counts = dict(zip(
+    counts_df["unit_type"],
+    counts_df["count"].fillna(0).clip(0, MAX_COUNT).astype(np.int32),   # no wraparound
+))
+
+# Subtype columns only change when the tables' columns do; keep them in
+# session state keyed on the column signature
+col_sig = (tuple(cons_df.columns), tuple(cap_df.columns))
+if st.session_state.get("col_sig") != col_sig:
+    st.session_state["rate_cols"] = subtype_columns(cons_df.columns, RATE_SUFFIX)
+    st.session_state["cap_cols"]  = subtype_columns(cap_df.columns,  CAP_SUFFIX)
+    st.session_state["col_sig"]   = col_sig
+rate_cols = st.session_state["rate_cols"]
+cap_cols  = st.session_state["cap_cols"]
+col_meta     = column_meta(rate_cols + cap_cols)
+base_to_caps = caps_by_base(cap_cols, col_meta)
 
 with st.sidebar.expander("Select Subtypes to Include"):
     selected_rates = st.multiselect("Consumption subtypes", rate_cols, default=rate_cols)
@@ -188,13 +358,18 @@ if not selected_rates or not selected_caps:
     st.error("Select at least one consumption and one capacity subtype.")
     st.stop()
 
-# Compute details & totals
-req_detail, cap_detail, total_req, total_cap = compute_totals(
-    cons_df, cap_df, action, unit_counts, selected_rates, selected_caps
+# Compute totals (hashable args for the cache). Blank unit types (e.g. rows
+# added in the editor) cannot be sorted against names and count as 0 anyway.
+counts_key = tuple(sorted((u, n) for u, n in unit_counts.items() if pd.notna(u)))
+totals_args = (
+    cons_df, cap_df, action, counts_key, tuple(selected_rates), tuple(selected_caps)
 )
+total_req, total_cap = compute_totals(*totals_args)
 
 # Build grouped summary
-group_df = build_group_summary(total_req, total_cap, selected_rates, selected_caps)
+group_df = build_group_summary(
+    total_req, total_cap, tuple(selected_rates), tuple(selected_caps), col_meta
+)
 
 # ──────────────────────────────────────────────────────────────────────────────
 #  Overview Metrics 
@@ -209,10 +384,7 @@ for col, (grp, row) in zip(cols, group_df.iterrows()):
 
 # Main grouped table
 st.subheader(f"Grouped Summary for {action.replace('_',' ').title()}")
-group_fmt = group_df.copy()
-for c in group_fmt.columns:
-    if c != "Deficit Subtypes":
-        group_fmt[c] = group_fmt[c].apply(fmt_parenthesis)
+group_fmt = group_df.assign(**fmt_parenthesis_frame(group_df.drop(columns="Deficit Subtypes")))
 st.table(group_fmt)
 
 # Bar chart
@@ -221,12 +393,15 @@ if st.checkbox("Show bar chart of grouped summary"):
 
 # Detailed Subtype Summary
 with st.expander("🔍 Detailed Subtype Summary"):
+    # Positional access into the totals arrays instead of label lookups
+    req_arr, cap_arr = total_req.to_numpy(), total_cap.to_numpy()
+    cap_idx = {c: i for i, c in enumerate(selected_caps)}
     comp_rows = []
-    for rate in selected_rates:
-        base = rate.replace(RATE_SUFFIX, "")
-        caps = [c for c in selected_caps if c.startswith(base)]
-        raw_req = total_req[rate]
-        raw_cap = sum(total_cap[c] for c in caps)
+    for i, rate in enumerate(selected_rates):
+        base = col_meta[rate][1]
+        caps = [c for c in base_to_caps.get(base, []) if c in cap_idx]
+        raw_req = req_arr[i]
+        raw_cap = cap_arr[[cap_idx[c] for c in caps]].sum()
 
         # BOTH floored
         req_i     = math.floor(raw_req)
@@ -241,17 +416,25 @@ with st.expander("🔍 Detailed Subtype Summary"):
         })
 
     comp_df = pd.DataFrame(comp_rows).set_index("Subtype")
-    st.table(comp_df.applymap(fmt_parenthesis))
+    st.table(fmt_parenthesis_frame(comp_df))
 
 # Raw Details
+# The expander body runs on every rerun, so the breakdown is only built once
+# the user asks for it.
 with st.expander("Raw Details (post‑count)"):
-    st.markdown("**Consumption Breakdown**")
-    fmt_map_req = {c:"{:,.0f}" for c in selected_rates + ["count"]}
-    st.dataframe(req_detail.style.format(fmt_map_req), height=300)
-
-    st.markdown("**Capacity Breakdown**")
-    fmt_map_cap = {c:"{:,.0f}" for c in selected_caps + ["count"]}
-    st.dataframe(cap_detail.style.format(fmt_map_cap), height=300)
+    if st.checkbox("Show per-unit breakdown", key="show_raw"):
+        req_detail, cap_detail = build_detail_frames(*totals_args)
+
+        # Formatted client-side via column_config rather than a pandas Styler
+        st.markdown("**Consumption Breakdown**")
+        cfg_req = {c: st.column_config.NumberColumn(format="%,.0f")
+                   for c in selected_rates + ["count"]}
+        st.dataframe(req_detail, column_config=cfg_req, height=300)
+
+        st.markdown("**Capacity Breakdown**")
+        cfg_cap = {c: st.column_config.NumberColumn(format="%,.0f")
+                   for c in selected_caps + ["count"]}
+        st.dataframe(cap_detail, column_config=cfg_cap, height=300)
 
 # -- Footer with your name in bottom‐right corner
 st.markdown(